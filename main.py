@@ -5,9 +5,17 @@ import json
 import logging
 import requests
 import datetime
-import re
+import functools
+import hashlib
+import random
+import shutil
 import time
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from typing import Dict, Any, List, Optional, Union, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # 导入Word生成模块
 from word_generator import WordGenerator
@@ -19,6 +27,272 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 模块所在目录，数据目录基于此目录
+_MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 从模型响应中提取JSON时复用的解码器，所有解析都通过raw_decode完成
+_JSON_DECODER = json.JSONDecoder()
+
+
+class _JitterRetry(Retry):
+    """在指数退避的基础上增加随机抖动，避免并发请求在同一时刻集中重试"""
+
+    def get_backoff_time(self) -> float:
+        backoff = super().get_backoff_time()
+        return backoff * random.uniform(0.5, 1.5) if backoff > 0 else backoff
+
+
+# 共享的HTTP会话，复用连接（keep-alive），避免每次请求重新建立TCP/TLS连接
+# 遇到限流或服务端错误时自动退避重试（优先遵循Retry-After），重试耗尽后返回最后一次响应
+_SESSION = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=_JitterRetry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["POST", "GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+)
+_SESSION.mount("https://", _HTTP_ADAPTER)
+_SESSION.mount("http://", _HTTP_ADAPTER)
+
+# 共享的图像下载线程池，下载在后台进行，不阻塞下一次图像生成请求
+_DOWNLOAD_POOL = ThreadPoolExecutor(max_workers=8)
+
+
+class _RateLimiter:
+    """
+    线程安全的令牌桶限流器，按每分钟请求数限制请求频率
+    
+    令牌按固定速率补充，桶中有令牌时请求立即发出，最多允许burst个请求突发，
+    令牌耗尽时才等待，不会像固定间隔那样在空闲时也白白等待
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """阻塞到获得一个令牌为止，requests_per_minute不大于0时不限流"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_time) * self.rate)
+                self._last_time = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            logger.info("达到请求频率限制，等待 %.1f 秒后继续生成下一张图片...", wait_time)
+            time.sleep(wait_time)
+
+
+def _download_and_save(image_url: str, local_image_path: str) -> Optional[str]:
+    """
+    下载图像并保存到本地
+    
+    Args:
+        image_url: 图像URL
+        local_image_path: 本地保存路径
+        
+    Returns:
+        保存成功时返回本地路径，否则返回None
+    """
+    try:
+        # 以流的方式下载图像，边下载边写入文件，不在内存中缓存完整图像
+        with _SESSION.get(image_url, stream=True, timeout=30) as img_response:
+            if img_response.status_code == 200:
+                # 按Content-Encoding解压（如gzip）后再写入
+                img_response.raw.decode_content = True
+                with open(local_image_path, "wb") as img_file:
+                    shutil.copyfileobj(img_response.raw, img_file, length=1 << 20)
+                
+                logger.info("图像已保存到本地: %s", local_image_path)
+                return local_image_path
+            else:
+                logger.error("下载图像失败，状态码: %s", img_response.status_code)
+    except Exception as e:
+        logger.error("保存图像时发生错误: %s", e)
+    return None
+
+
+# 系统提示词模板，{imitation_count}和{picture_count}为题目数量占位符
+_SYSTEM_PROMPT_TEMPLATE = """## 角色：题目生成专家擅长生成小学二年级句子仿写和看图写话练习题
+## 注意：如果用户有要求，请按用户提供的的要求生成题目，用户的要求只针对题目而不针对格式
+
+## 格式要求：
+2、请以纯JSON的形式进行回复，拒绝使用任何markdown语法和出现其它文字
+2、首先格式为数组，第一个对象为句子仿写练习题，第二个对象为生成看图写话练习题
+3、对象里包含了题目的大题标题，字段名为maxTitle
+4、对象里还包含了题目要求字段，字段名为require
+5、接着是题目数组的基本结构，数组里包含多个题目对象，每个题目对象包含以下基础字段：
+ - 序号，number
+ - 问题，question
+ - 参考答案，reference_answer
+6、所有JSON字段必须为英文，题目都为中文
+
+### 步骤一：生成句子仿写练习题
+2、按结构生成{imitation_count}个句子仿写练习题
+2、首先先生成仿写题目的例句
+3、生成例句和参考答案后，根据以下要求来生成仿写引导：
+ - 在题目对象中增加Imitate_writing数组字段
+ - 把参考答案去掉多个空，例如参考答案为"小兔子在草地上跑来跑去"，去空后："小兔子在（）上（）"
+ - 然后把剩下的文字按顺序放入Imitate_writing数组中，数组例子：["小兔子在","","上",""]
+4、注意不要以例子来生成题目，要保证题目的多样性，例子只是给你作为格式的理解和参考，不要把参考答案分割放入Imitate_writing中，而是将参考答案按例子去除留空后，将剩余的文字按顺序放入数组
+5、仿写引导例子只做格式参考，不做生成题目参考
+
+### 步骤二：生成看图写话练习题
+2、首先按结构生成{picture_count}个看图写话练习题
+2、在看图写话练习题对象中的题目数组增加字段，prompt提示词字段
+3、提示词为图片的描述，要符合场景，要描述详细，细节都要描述出来，包括细节、场景、动作，等等，图片提示词风格为卡通风格
+4、问题要根据提示词的描述来进行提问"""
+
+
+@functools.lru_cache(maxsize=32)
+def _format_system_prompt(imitation_count: int, picture_count: int) -> str:
+    """按题目数量格式化系统提示词，相同数量的结果会被缓存"""
+    return _SYSTEM_PROMPT_TEMPLATE.format(imitation_count=imitation_count, picture_count=picture_count)
+
+
+def _build_context(imitation_count: int, picture_count: int, user_requirements: str) -> List[Dict[str, str]]:
+    """
+    构建生成题目的对话上下文
+    
+    Args:
+        imitation_count: 句子仿写题数量
+        picture_count: 看图写话题数量
+        user_requirements: 用户要求
+        
+    Returns:
+        包含系统提示词和用户提示词的上下文
+    """
+    return [
+        {"role": "system", "content": _format_system_prompt(imitation_count, picture_count)},
+        {"role": "user", "content": f"题目要求：{user_requirements}"}
+    ]
+
+
+def _save_json(path: str, data: Any, indent: Optional[int] = None):
+    """
+    将数据保存为JSON文件
+    
+    先整体序列化再一次性写入大缓冲区的文件，比json.dump逐段写入更快；
+    indent为None时使用紧凑格式，适用于仅供程序读取的文件
+    
+    Args:
+        path: 文件路径
+        data: 要保存的数据
+        indent: 缩进空格数，默认为None（紧凑格式）
+    """
+    separators = None if indent is not None else (",", ":")
+    text = json.dumps(data, ensure_ascii=False, indent=indent, separators=separators)
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write(text)
+
+
+def _decode_json_at(content: str, index: int) -> Optional[Union[List, Dict]]:
+    """从指定位置解码一个JSON值，忽略其后的多余内容，解码失败返回None"""
+    try:
+        return _JSON_DECODER.raw_decode(content, index)[0]
+    except json.JSONDecodeError:
+        return None
+
+
+def _extract_json(content: str) -> Optional[Union[List, Dict]]:
+    """
+    从模型响应内容中提取JSON数据
+    
+    使用线性扫描代替正则表达式，避免回溯和嵌套反引号导致的截断问题
+    
+    Args:
+        content: 模型响应内容
+        
+    Returns:
+        解析后的JSON数据，无法提取时返回None
+    """
+    # 尝试直接解析整个响应，响应不以JSON开头时（如markdown代码块）直接跳过
+    # 与json.loads一致，JSON之后只能有空白，"[2]道题目如下：..."之类的响应交给后面的方法处理
+    index = len(content) - len(content.lstrip())
+    if content.startswith(("[", "{"), index):
+        try:
+            data, end = _JSON_DECODER.raw_decode(content, index)
+        except json.JSONDecodeError:
+            end = -1
+        if end == len(content.rstrip()):
+            logger.info("成功直接解析响应为JSON")
+            return data
+    logger.info("直接解析失败，尝试其他提取方法")
+    
+    # 尝试提取被反引号包围的JSON (```json ... ```)
+    # 直接从代码块开头解码，不依赖结束标记，JSON字符串中出现的反引号不会截断代码块
+    start = content.find("```")
+    while start != -1:
+        index = start + 3
+        if content.startswith("json", index):
+            index += 4
+        while index < len(content) and content[index].isspace():
+            index += 1
+        
+        if content.startswith(("[", "{"), index):
+            data = _decode_json_at(content, index)
+            if data is not None:
+                logger.info("成功解析被反引号包围的JSON块")
+                return data
+        
+        # 跳过当前代码块，继续查找下一个
+        end = content.find("```", index)
+        if end == -1:
+            break
+        start = content.find("```", end + 3)
+    
+    # 如果还是没有找到，依次从每个后面紧跟"{"的"["处尝试解码题目数组，
+    # 跳过正文中"[2]"、"[]"之类的方括号，只接受非空的对象数组
+    index = content.find("[")
+    while index != -1:
+        next_index = index + 1
+        while next_index < len(content) and content[next_index].isspace():
+            next_index += 1
+        if content.startswith("{", next_index):
+            data = _decode_json_at(content, index)
+            if isinstance(data, list) and data and isinstance(data[0], dict):
+                logger.info("成功提取并解析JSON数组")
+                return data
+        index = content.find("[", index + 1)
+    
+    return None
+
+
+def _summarize_exercises(exercises_data: Union[List, Dict]) -> Tuple[int, List[Dict]]:
+    """
+    单次遍历题目数据，统计题目数量并收集需要生成图片的看图写话题
+    
+    Args:
+        exercises_data: 题目数据
+        
+    Returns:
+        (题目数量, 带图片提示词的看图写话题列表)
+    """
+    question_count = 0
+    image_questions = []
+    for item in exercises_data:
+        if not isinstance(item, dict):
+            continue
+        questions = item.get("questions", [])
+        question_count += len(questions)
+        if item.get("maxTitle") == "看图写话练习题":
+            image_questions.extend(question for question in questions
+                                   if isinstance(question, dict) and "prompt" in question)
+    return question_count, image_questions
+
 
 # 模型调用方法，支持不同的模型类型，直接返回模型响应内容
 def call_model(context: List[Dict[str, str]], 
@@ -41,7 +315,7 @@ def call_model(context: List[Dict[str, str]],
     Returns:
         模型响应内容和错误信息（如果有）的元组
     """
-    logger.info(f"调用模型: {model_name}")
+    logger.info("调用模型: %s", model_name)
     
     # 根据不同的模型类型调用不同的API
     if model_type == "openai":
@@ -55,7 +329,7 @@ def call_model(context: List[Dict[str, str]],
             }
             
             # 发送请求
-            response = requests.post(
+            response = _SESSION.post(
                 f"{base_url}/chat/completions",
                 headers={
                     "Content-Type": "application/json",
@@ -71,13 +345,14 @@ def call_model(context: List[Dict[str, str]],
                 if "choices" in result and len(result["choices"]) > 0:
                     if "message" in result["choices"][0] and "content" in result["choices"][0]["message"]:
                         content = result["choices"][0]["message"]["content"]
-                        logger.info(f"成功获取OpenAI响应，内容长度: {len(content)}")
+                        logger.info("成功获取OpenAI响应，内容长度: %s", len(content))
                         return content, ""
                     else:
                         return None, "OpenAI响应格式异常：未找到message.content字段"
                 else:
                     return None, "OpenAI响应格式异常：未找到choices字段或choices为空"
             else:
+                # 可重试的错误已由会话自动重试，到这里说明重试已耗尽或错误不可重试
                 error_msg = f"API调用失败: {response.status_code}, {response.text}"
                 logger.error(error_msg)
                 return None, error_msg
@@ -94,6 +369,61 @@ def call_model(context: List[Dict[str, str]],
         return None, error_msg
 
 
+def _cached_call_model(context: List[Dict[str, str]],
+                       api_key: str,
+                       base_url: str,
+                       model_name: str,
+                       model_type: str,
+                       temperature: float = 0.7,
+                       cache: bool = True) -> Tuple[Optional[str], str]:
+    """
+    带磁盘缓存的模型调用，相同的上下文、模型和温度参数直接返回缓存的响应内容
+    
+    缓存以上下文、API地址、模型名称和温度参数的哈希值为键，保存在data/.cache目录下，
+    只缓存成功的响应
+    
+    Args:
+        context: 对话上下文，包含历史消息
+        api_key: API密钥
+        base_url: API基础URL
+        model_name: 模型名称
+        model_type: 模型类型
+        temperature: 模型温度参数，控制随机性，默认0.7
+        cache: 是否使用缓存，默认为True
+        
+    Returns:
+        模型响应内容和错误信息（如果有）的元组
+    """
+    if not cache:
+        return call_model(context, api_key, base_url, model_name, model_type, temperature)
+    
+    key_source = json.dumps(
+        {"context": context, "base_url": base_url, "model": model_name, "temperature": temperature},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    key = hashlib.blake2b(key_source.encode("utf-8"), digest_size=16).hexdigest()
+    cache_dir = os.path.join(_MODULE_DIR, "data", ".cache")
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            content = json.load(f)["content"]
+        logger.info("命中模型响应缓存: %s", cache_path)
+        return content, ""
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("读取模型响应缓存失败，将重新调用模型: %s", e)
+    
+    content, error = call_model(context, api_key, base_url, model_name, model_type, temperature)
+    if content is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _save_json(cache_path, {"content": content})
+        logger.info("模型响应已缓存到: %s", cache_path)
+    return content, error
+
+
 def generate_image(prompt: str,
                   api_key: str,
                   base_url: str,
@@ -101,7 +431,10 @@ def generate_image(prompt: str,
                   model_type: str = "openai",
                   size: str = "768x768",
                   n: int = 1,
-                  output_dir: str = None) -> Tuple[Optional[str], Optional[Dict], str, Optional[str]]:
+                  output_dir: str = None,
+                  download_futures: Optional[List[Future]] = None,
+                  run_timestamp: Optional[str] = None,
+                  debug_dump: bool = False) -> Tuple[Optional[str], Optional[Dict], str, Optional[str]]:
     """
     生成图像并返回图像URL
     
@@ -114,17 +447,26 @@ def generate_image(prompt: str,
         size: 图像尺寸，默认为"768x768"
         n: 生成图像数量，默认为1
         output_dir: 保存图像的目录，如果提供则会将图像保存到该目录
+        download_futures: 如果提供，图像下载将提交到后台线程池，对应的Future追加到该列表，
+            返回的本地路径为预定的保存路径，需等待Future完成后才可使用
+        run_timestamp: 本次运行的时间戳，用作文件名前缀，未提供时使用当前时间
+        debug_dump: 是否将本次调用的响应数据单独保存为JSON文件，用于调试，默认为False
         
     Returns:
         包含图像URL、完整响应数据和错误信息（如果有）的元组
     """
-    logger.info(f"开始生成图像，使用模型: {model_name}, 提示词长度: {len(prompt)}")
+    logger.info("开始生成图像，使用模型: %s, 提示词长度: %s", model_name, len(prompt))
     
     image_url = None
     response_data = None
     error_msg = ""
     local_image_path = None
     
+    # 文件名由运行时间戳和随机后缀组成，避免同一秒内生成的多张图片互相覆盖
+    if run_timestamp is None:
+        run_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    file_id = f"{run_timestamp}_{uuid.uuid4().hex[:8]}"
+    
     # 根据不同的模型类型调用不同的API
     if model_type == "openai":
         try:
@@ -137,7 +479,7 @@ def generate_image(prompt: str,
             }
             
             # 发送请求
-            response = requests.post(
+            response = _SESSION.post(
                 f"{base_url}/images/generations",
                 headers={
                     "Content-Type": "application/json",
@@ -153,33 +495,27 @@ def generate_image(prompt: str,
                 if "data" in response_data and len(response_data["data"]) > 0:
                     if "url" in response_data["data"][0]:
                         image_url = response_data["data"][0]["url"]
-                        logger.info(f"成功获取图像URL: {image_url[:50]}...")
+                        logger.info("成功获取图像URL: %.50s...", image_url)
                         
                         # 如果提供了输出目录，则下载并保存图像
                         if output_dir and image_url:
-                            try:
-                                # 下载图像
-                                img_response = requests.get(image_url, timeout=30)
-                                if img_response.status_code == 200:
-                                    # 生成图像文件名
-                                    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    image_filename = f"image_{timestamp}.png"
-                                    local_image_path = os.path.join(output_dir, image_filename)
-                                    
-                                    # 保存图像
-                                    with open(local_image_path, "wb") as img_file:
-                                        img_file.write(img_response.content)
-                                    
-                                    logger.info(f"图像已保存到本地: {local_image_path}")
-                                else:
-                                    logger.error(f"下载图像失败，状态码: {img_response.status_code}")
-                            except Exception as e:
-                                logger.error(f"保存图像时发生错误: {str(e)}")
+                            # 生成图像文件名
+                            image_filename = f"image_{file_id}.png"
+                            local_image_path = os.path.join(output_dir, image_filename)
+                            
+                            if download_futures is not None:
+                                # 在后台下载，调用方负责等待完成
+                                download_futures.append(
+                                    _DOWNLOAD_POOL.submit(_download_and_save, image_url, local_image_path)
+                                )
+                            else:
+                                local_image_path = _download_and_save(image_url, local_image_path)
                     else:
                         error_msg = "响应格式异常：未找到url字段"
                 else:
                     error_msg = "响应格式异常：未找到data字段或data为空"
             else:
+                # 可重试的错误已由会话自动重试，到这里说明重试已耗尽或错误不可重试
                 error_msg = f"API调用失败: {response.status_code}, {response.text}"
                 logger.error(error_msg)
                 
@@ -196,30 +532,100 @@ def generate_image(prompt: str,
         error_msg = f"未实现的图像生成模型类型: {model_type}"
         logger.warning(error_msg)
     
-    # 保存响应数据到JSON文件
-    if response_data:
+    # 调试时保存响应数据到JSON文件
+    if debug_dump and response_data:
         # 确定保存目录
         if output_dir:
             data_dir = output_dir
         else:
             # 使用默认的data目录
-            data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
-            if not os.path.exists(data_dir):
-                os.makedirs(data_dir)
-                logger.info(f"创建数据目录: {data_dir}")
+            data_dir = os.path.join(_MODULE_DIR, "data")
+            os.makedirs(data_dir, exist_ok=True)
         
-        # 生成时间戳文件名
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_file_path = os.path.join(data_dir, f"image_response_{timestamp}.json")
+        # 与图像文件使用相同的文件名后缀，便于对应
+        json_file_path = os.path.join(data_dir, f"image_response_{file_id}.json")
         
-        with open(json_file_path, "w", encoding="utf-8") as f:
-            json.dump(response_data, f, ensure_ascii=False, indent=4)
+        _save_json(json_file_path, response_data, indent=4)
         
-        logger.info(f"图像生成响应数据已保存到: {json_file_path}")
+        logger.info("图像生成响应数据已保存到: %s", json_file_path)
     
     return image_url, response_data, error_msg, local_image_path
 
 
+def generate_images_batch(prompts: List[str],
+                          api_key: str,
+                          base_url: str,
+                          model_name: str = "dall-e-3",
+                          model_type: str = "openai",
+                          size: str = "768x768",
+                          output_dir: str = None,
+                          batch_size: int = 4,
+                          rpm: float = 0,
+                          run_timestamp: Optional[str] = None) -> List[Tuple[Optional[str], str, Optional[str], Optional[Dict]]]:
+    """
+    批量生成图像
+    
+    图像生成接口每次请求只接受一个提示词（n参数只会生成同一提示词的多个变体），
+    因此以batch_size为并发上限同时发送请求，所有图像在后台下载，全部完成后统一返回
+    
+    Args:
+        prompts: 图像生成提示词列表
+        api_key: API密钥
+        base_url: API基础URL
+        model_name: 模型名称，默认为"dall-e-3"
+        model_type: 模型类型，默认为"openai"
+        size: 图像尺寸，默认为"768x768"
+        output_dir: 保存图像的目录，如果提供则会将图像保存到该目录
+        batch_size: 同时进行的图像生成请求数量，默认为4
+        rpm: 每分钟最多发起的请求数，默认为0（不限制）
+        run_timestamp: 本次运行的时间戳，用作文件名前缀，未提供时使用当前时间
+        
+    Returns:
+        与prompts顺序一致的列表，每项为图像URL、错误信息、本地图像路径和完整响应数据的元组
+    """
+    if not prompts:
+        return []
+    
+    logger.info("开始批量生成图像，数量: %s, 批大小: %s", len(prompts), batch_size)
+    
+    # 限制请求频率，避免触发接口限流，突发数量不超过并发数
+    limiter = _RateLimiter(rpm, burst=batch_size)
+    
+    # 同一批图像共用一个时间戳
+    if run_timestamp is None:
+        run_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    def _generate(prompt):
+        limiter.wait()
+        download_futures = []
+        image_url, response_data, error, local_image_path = generate_image(
+            prompt=prompt,
+            api_key=api_key,
+            base_url=base_url,
+            model_name=model_name,
+            model_type=model_type,
+            size=size,
+            output_dir=output_dir,
+            download_futures=download_futures,
+            run_timestamp=run_timestamp
+        )
+        download_future = download_futures[0] if download_futures else None
+        return image_url, error, download_future, response_data
+    
+    # 各提示词的图片相互独立，并发生成以缩短总耗时
+    max_workers = max(1, min(batch_size, len(prompts)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_generate, prompts))
+    
+    # 等待所有后台下载完成，只返回下载成功的本地路径
+    wait([future for _, _, future, _ in results if future is not None])
+    
+    return [
+        (image_url, error, download_future.result() if download_future else None, response_data)
+        for image_url, error, download_future, response_data in results
+    ]
+
+
 def process_exercises_with_images(
     api_key: str,
     base_url: str,
@@ -234,7 +640,9 @@ def process_exercises_with_images(
     image_model: str = "dall-e-3",
     image_model_type: str = "openai",
     image_size: str = "768x768",
-    image_delay: float = 2.0
+    image_rpm: float = 30,
+    image_batch_size: int = 4,
+    cache: bool = False
 ) -> Tuple[str, Optional[Union[List, Dict]]]:
     """
     处理整个练习生成流程，包括生成题目、生成图片和创建Word文档
@@ -253,101 +661,36 @@ def process_exercises_with_images(
         image_model: 图像生成模型，默认为"dall-e-3"
         image_model_type: 图像生成模型类型，默认为"openai"
         image_size: 图像尺寸，默认为"768x768"
-        image_delay: 图像生成请求之间的延迟时间（秒），默认为2.0秒
+        image_rpm: 每分钟最多发起的图像生成请求数，默认为30，不大于0时不限制
+        image_batch_size: 批量生成图像时同时进行的请求数量，默认为4
+        cache: 是否复用相同请求的模型响应缓存，默认为False
         
     Returns:
         输出目录路径和处理后的数据的元组
     """
-    logger.info(f"开始处理练习生成流程，句子仿写题数量: {imitation_count}, 看图写话题数量: {picture_count}")
-    
-    # 系统提示词
-    system_prompt = """## 角色：题目生成专家擅长生成小学二年级句子仿写和看图写话练习题
-## 注意：如果用户有要求，请按用户提供的的要求生成题目，用户的要求只针对题目而不针对格式
-
-## 格式要求：
-2、请以纯JSON的形式进行回复，拒绝使用任何markdown语法和出现其它文字
-2、首先格式为数组，第一个对象为句子仿写练习题，第二个对象为生成看图写话练习题
-3、对象里包含了题目的大题标题，字段名为maxTitle
-4、对象里还包含了题目要求字段，字段名为require
-5、接着是题目数组的基本结构，数组里包含多个题目对象，每个题目对象包含以下基础字段：
- - 序号，number
- - 问题，question
- - 参考答案，reference_answer
-6、所有JSON字段必须为英文，题目都为中文
-
-### 步骤一：生成句子仿写练习题
-2、按结构生成{imitation_count}个句子仿写练习题
-2、首先先生成仿写题目的例句
-3、生成例句和参考答案后，根据以下要求来生成仿写引导：
- - 在题目对象中增加Imitate_writing数组字段
- - 把参考答案去掉多个空，例如参考答案为"小兔子在草地上跑来跑去"，去空后："小兔子在（）上（）"
- - 然后把剩下的文字按顺序放入Imitate_writing数组中，数组例子：["小兔子在","","上",""]
-4、注意不要以例子来生成题目，要保证题目的多样性，例子只是给你作为格式的理解和参考，不要把参考答案分割放入Imitate_writing中，而是将参考答案按例子去除留空后，将剩余的文字按顺序放入数组
-5、仿写引导例子只做格式参考，不做生成题目参考
-
-### 步骤二：生成看图写话练习题
-2、首先按结构生成{picture_count}个看图写话练习题
-2、在看图写话练习题对象中的题目数组增加字段，prompt提示词字段
-3、提示词为图片的描述，要符合场景，要描述详细，细节都要描述出来，包括细节、场景、动作，等等，图片提示词风格为卡通风格
-4、问题要根据提示词的描述来进行提问"""
-    
-    # 用户提示词
-    user_prompt = f"题目要求：{user_requirements}"
+    logger.info("开始处理练习生成流程，句子仿写题数量: %s, 看图写话题数量: %s", imitation_count, picture_count)
     
     # 构建上下文
-    context = [
-        {"role": "system", "content": system_prompt.format(imitation_count=imitation_count, picture_count=picture_count)},
-        {"role": "user", "content": user_prompt}
-    ]
+    context = _build_context(imitation_count, picture_count, user_requirements)
     
     # 调用模型获取原始响应内容
-    content, error = call_model(
+    content, error = _cached_call_model(
         context=context,
         api_key=api_key,
         base_url=base_url,
         model_name=model_name,
         model_type=model_type,
-        temperature=temperature
+        temperature=temperature,
+        cache=cache
     )
     
     if content is None:
-        logger.error(f"获取模型响应失败: {error}")
+        logger.error("获取模型响应失败: %s", error)
         print(f"生成题目失败: {error}")
         return None, None
     
     # 尝试从响应中提取JSON数据
-    exercises_data = None
-    
-    # 尝试直接解析整个响应
-    try:
-        exercises_data = json.loads(content)
-        logger.info("成功直接解析响应为JSON")
-    except json.JSONDecodeError:
-        logger.info("直接解析失败，尝试其他提取方法")
-        
-        # 尝试提取被反引号包围的JSON (```json ... ```)
-        json_pattern = r'```(?:json)?\s*([\s\S]*?)```'
-        matches = re.findall(json_pattern, content)
-        
-        if matches:
-            logger.info(f"找到{len(matches)}个被反引号包围的JSON块")
-            for match in matches:
-                try:
-                    exercises_data = json.loads(match.strip())
-                    logger.info("成功解析被反引号包围的JSON块")
-                    break
-                except json.JSONDecodeError:
-                    continue
-        
-        # 如果还是没有找到，尝试查找可能的JSON数组
-        if exercises_data is None:
-            array_match = re.search(r'\[\s*{.*}\s*\]', content, re.DOTALL)
-            if array_match:
-                try:
-                    exercises_data = json.loads(array_match.group(0))
-                    logger.info("成功提取并解析JSON数组")
-                except json.JSONDecodeError:
-                    logger.warning("找到可能的JSON数组但解析失败")
+    exercises_data = _extract_json(content)
     
     # 如果无法提取JSON数据
     if exercises_data is None:
@@ -355,84 +698,102 @@ def process_exercises_with_images(
         print(f"生成题目失败: 无法提取有效的JSON数据")
         return None, None
     
-    # 创建输出目录
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        logger.info(f"创建数据目录: {data_dir}")
+    # data目录
+    data_dir = os.path.join(_MODULE_DIR, "data")
     
     # 生成时间戳目录名
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = os.path.join(data_dir, timestamp)
     
-    # 创建时间戳目录
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        logger.info(f"创建输出目录: {output_dir}")
+    # 创建时间戳目录（同时创建data目录）
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info("创建输出目录: %s", output_dir)
     
     # 保存原始JSON数据到时间戳目录
     json_file_path = os.path.join(output_dir, "exercises.json")
-    with open(json_file_path, "w", encoding="utf-8") as f:
-        json.dump(exercises_data, f, ensure_ascii=False, indent=4)
+    _save_json(json_file_path, exercises_data, indent=4)
     
-    logger.info(f"原始题目数据已保存到: {json_file_path}")
+    logger.info("原始题目数据已保存到: %s", json_file_path)
     
     # 为看图写话题目生成图片
     logger.info("开始为看图写话题目生成图片")
     
-    # 查找看图写话练习题
-    for item in exercises_data:
-        if isinstance(item, dict) and item.get("maxTitle") == "看图写话练习题":
-            questions = item.get("questions", [])
-            for i, question in enumerate(questions):
-                if "prompt" in question:
-                    # 使用prompt作为图片生成提示词
-                    prompt = question["prompt"]
-                    logger.info(f"为题目 {question.get('number')} 生成图片，提示词长度: {len(prompt)}")
-                    
-                    # 添加延迟，避免频繁请求
-                    if i > 0 and image_delay > 0:
-                        logger.info(f"等待 {image_delay} 秒后继续生成下一张图片...")
-                        time.sleep(image_delay)
-                    
-                    # 调用图片生成API，使用单独的图片API配置
-                    image_url, response_data, error, local_image_path = generate_image(
-                        prompt=prompt,
-                        api_key=image_api_key,
-                        base_url=image_base_url,
-                        model_name=image_model,
-                        model_type=image_model_type,
-                        size=image_size,
-                        output_dir=output_dir
-                    )
-                    
-                    if image_url:
-                        # 将图片URL添加到题目数据中
-                        question["image_url"] = image_url
-                        # 如果有本地图片路径，也添加到题目数据中
-                        if local_image_path:
-                            question["local_image_path"] = local_image_path
-                        logger.info(f"成功为题目 {question.get('number')} 生成图片")
-                    else:
-                        logger.error(f"为题目 {question.get('number')} 生成图片失败: {error}")
-                        print(f"为题目 {question.get('number')} 生成图片失败: {error}")
-    
-    # 更新JSON数据（包含图片URL和本地路径）
-    updated_json_file_path = os.path.join(output_dir, "exercises_with_images.json")
-    with open(updated_json_file_path, "w", encoding="utf-8") as f:
-        json.dump(exercises_data, f, ensure_ascii=False, indent=4)
-    
-    logger.info(f"带图片URL的题目数据已保存到: {updated_json_file_path}")
-    
-    # 生成Word文档
-    try:
-        word_generator = WordGenerator()
-        word_file_path = os.path.join(output_dir, "exercises.docx")
-        word_generator.create_document(exercises_data, word_file_path)
-        logger.info(f"Word文档已生成: {word_file_path}")
-    except Exception as e:
-        logger.error(f"生成Word文档时发生错误: {str(e)}")
-        print(f"生成Word文档时发生错误: {str(e)}")
+    # 单次遍历题目数据，统计题目数量并收集所有需要生成图片的题目
+    question_count, image_questions = _summarize_exercises(exercises_data)
+    logger.info("共 %s 道题目，其中 %s 道需要生成图片", question_count, len(image_questions))
+    
+    # 图片生成与Word文档渲染互相重叠：图片在后台线程批量生成，
+    # Word文档先渲染不需要图片的部分，渲染到看图写话题时再等待图片结果
+    images_applied = False
+    images_future = None
+    
+    def _apply_image_results():
+        nonlocal images_applied
+        if images_applied:
+            return
+        # 先标记为已处理，处理中途失败时不会在兜底调用中重复执行并再次抛出同样的异常
+        images_applied = True
+        
+        if images_future is not None:
+            results = images_future.result()
+            for question, (image_url, error, local_image_path, _) in zip(image_questions, results):
+                if image_url:
+                    # 将图片URL添加到题目数据中
+                    question["image_url"] = image_url
+                    # 如果有本地图片路径，也添加到题目数据中
+                    if local_image_path:
+                        question["local_image_path"] = local_image_path
+                    logger.info("成功为题目 %s 生成图片", question.get('number'))
+                else:
+                    logger.error("为题目 %s 生成图片失败: %s", question.get('number'), error)
+                    print(f"为题目 {question.get('number')} 生成图片失败: {error}")
+            
+            # 所有图像生成响应汇总后一次性保存
+            responses = [response_data for _, _, _, response_data in results if response_data]
+            if responses:
+                responses_file_path = os.path.join(output_dir, "image_responses.json")
+                _save_json(responses_file_path, responses, indent=4)
+                logger.info("图像生成响应数据已保存到: %s", responses_file_path)
+        
+        # 更新JSON数据（包含图片URL和本地路径），该文件仅供程序读取，不进行格式化缩进
+        updated_json_file_path = os.path.join(output_dir, "exercises_with_images.json")
+        _save_json(updated_json_file_path, exercises_data)
+        
+        logger.info("带图片URL的题目数据已保存到: %s", updated_json_file_path)
+    
+    with ThreadPoolExecutor(max_workers=1) as image_executor:
+        # 一次性批量生成所有图片，结果顺序与提示词顺序一致
+        if image_questions:
+            images_future = image_executor.submit(
+                generate_images_batch,
+                prompts=[question["prompt"] for question in image_questions],
+                api_key=image_api_key,
+                base_url=image_base_url,
+                model_name=image_model,
+                model_type=image_model_type,
+                size=image_size,
+                output_dir=output_dir,
+                batch_size=image_batch_size,
+                rpm=image_rpm,
+                run_timestamp=timestamp
+            )
+        
+        # 生成Word文档
+        try:
+            word_generator = WordGenerator()
+            word_file_path = os.path.join(output_dir, "exercises.docx")
+            word_generator.create_document(exercises_data, word_file_path, wait_for_images=_apply_image_results)
+            logger.info("Word文档已生成: %s", word_file_path)
+        except Exception as e:
+            logger.error("生成Word文档时发生错误: %s", e)
+            print(f"生成Word文档时发生错误: {str(e)}")
+        
+        # 文档中没有看图写话题或文档生成提前失败时，仍然需要写回图片结果
+        try:
+            _apply_image_results()
+        except Exception as e:
+            logger.error("写回图片结果时发生错误: %s", e)
+            print(f"写回图片结果时发生错误: {str(e)}")
     
     return output_dir, exercises_data
 
@@ -447,42 +808,37 @@ def generate_exercises(exercises_data: Union[List, Dict]) -> Tuple[str, Optional
     Returns:
         保存的目录路径和处理后的JSON数据的元组
     """
-    logger.info(f"开始处理题目数据")
+    logger.info("开始处理题目数据")
     
     if exercises_data is None:
         logger.error("题目数据为空")
         return "题目数据为空", None
     
-    # 确保data目录存在
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-        logger.info(f"创建数据目录: {data_dir}")
+    # data目录
+    data_dir = os.path.join(_MODULE_DIR, "data")
     
     # 生成时间戳目录名
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     output_dir = os.path.join(data_dir, timestamp)
     
-    # 创建时间戳目录
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-        logger.info(f"创建输出目录: {output_dir}")
+    # 创建时间戳目录（同时创建data目录）
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info("创建输出目录: %s", output_dir)
     
     # 保存JSON数据到时间戳目录
     json_file_path = os.path.join(output_dir, "exercises.json")
-    with open(json_file_path, "w", encoding="utf-8") as f:
-        json.dump(exercises_data, f, ensure_ascii=False, indent=4)
+    _save_json(json_file_path, exercises_data, indent=4)
     
-    logger.info(f"题目数据已保存到: {json_file_path}")
+    logger.info("题目数据已保存到: %s", json_file_path)
     
     # 生成Word文档
     try:
         word_generator = WordGenerator()
         word_file_path = os.path.join(output_dir, "exercises.docx")
         word_generator.create_document(exercises_data, word_file_path)
-        logger.info(f"Word文档已生成: {word_file_path}")
+        logger.info("Word文档已生成: %s", word_file_path)
     except Exception as e:
-        logger.error(f"生成Word文档时发生错误: {str(e)}")
+        logger.error("生成Word文档时发生错误: %s", e)
         print(f"生成Word文档时发生错误: {str(e)}")
     
     return output_dir, exercises_data
@@ -501,12 +857,14 @@ def main():
     image_model = "dall-e-3"  # 图片生成模型
     image_size = "1024x1024"  # 图片尺寸
     image_model_type = "openai"  # 图片生成模型类型
-    image_delay = 2.0  # 图片生成请求之间的延迟时间（秒）
+    image_rpm = 30  # 每分钟最多发起的图片生成请求数
+    image_batch_size = 4  # 批量生成图片时同时进行的请求数量
     
     # 题目生成参数
     imitation_count = 2  # 句子仿写题数量
     picture_count = 2  # 看图写话题数量
     user_requirements = "无其它要求"  # 用户要求
+    cache = False  # 是否复用相同请求的模型响应（调试或重新生成文档时可开启）
     
     # 调用处理流程
     output_dir, processed_data = process_exercises_with_images(
@@ -522,7 +880,9 @@ def main():
         image_model=image_model, # 图片生成模型
         image_model_type=image_model_type, # 图片生成模型类型
         image_size=image_size, # 图片尺寸
-        image_delay=image_delay # 图片生成请求之间的延迟时间
+        image_rpm=image_rpm, # 每分钟最多发起的图片生成请求数
+        image_batch_size=image_batch_size, # 批量生成图片时同时进行的请求数量
+        cache=cache # 是否复用相同请求的模型响应
     )
     
     if output_dir and processed_data:
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试从模型响应中提取题目JSON的功能
+"""
+
+from main import _extract_json
+
+# 模型返回的题目数组
+EXERCISES = '[{"maxTitle": "句子仿写练习题", "questions": [{"number": 1, "question": "例句：小鸟在树上唱歌。"}]}]'
+
+
+def test_direct_json():
+    """响应本身就是JSON"""
+    assert _extract_json(EXERCISES)[0]["maxTitle"] == "句子仿写练习题"
+
+
+def test_fenced_json():
+    """JSON在markdown代码块中"""
+    content = f"好的，题目如下：\n```json\n{EXERCISES}\n```\n"
+    assert _extract_json(content)[0]["maxTitle"] == "句子仿写练习题"
+
+
+def test_prose_with_brackets():
+    """正文中的方括号不能被当作题目数组"""
+    content = f"以下是[2]道题目：\n{EXERCISES}"
+    assert _extract_json(content)[0]["maxTitle"] == "句子仿写练习题"
+
+    content = f"x [] y {EXERCISES}"
+    assert _extract_json(content)[0]["maxTitle"] == "句子仿写练习题"
+
+
+def test_leading_bracketed_number():
+    """响应以带方括号的数字开头时，不能只解析开头的数字"""
+    content = f"[2]道题目如下：\n```json\n{EXERCISES}\n```\n"
+    assert _extract_json(content)[0]["maxTitle"] == "句子仿写练习题"
+
+    content = f"[1] 题目\n{EXERCISES}"
+    assert _extract_json(content)[0]["maxTitle"] == "句子仿写练习题"
+
+
+def test_no_exercises():
+    """没有题目数组时返回None"""
+    assert _extract_json("抱歉，[1, 2] 无法生成题目") is None
+
+
+def main():
+    """依次运行所有测试"""
+    print("开始测试JSON提取功能...")
+    for test in (test_direct_json, test_fenced_json, test_prose_with_brackets,
+                 test_leading_bracketed_number, test_no_exercises):
+        test()
+        print(f"{test.__doc__}：通过")
+    print("测试成功！")
+
+
+if __name__ == "__main__":
+    main()
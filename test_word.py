@@ -7,6 +7,10 @@
 
 import os
 import json
+import struct
+import zlib
+import zipfile
+from docx import Document
 from word_generator import WordGenerator
 
 def main():
@@ -74,6 +78,128 @@ def main():
         print("注意：参考答案已移至文档最后一页")
     except Exception as e:
         print(f"测试失败: {str(e)}")
+    
+    test_image_document()
+    test_picture_ids()
+    test_non_dict_items()
+
+def test_image_document():
+    """测试包含图片的文档保存时图片直接存储不再压缩"""
+    print("开始测试图片文档保存...")
+    
+    if not os.path.exists("test_data"):
+        os.makedirs("test_data")
+    image_path = os.path.join("test_data", "test_image.png")
+    _write_png(image_path)
+    
+    # 测试数据，多道带本地图片的看图写话题
+    count = 20
+    image_content = [
+        {
+            "maxTitle": "看图写话练习题",
+            "require": "请根据图片提示写一段话。",
+            "questions": [
+                {
+                    "number": i,
+                    "question": "图片里有什么？",
+                    "reference_answer": "图片里有一只小猫。",
+                    "local_image_path": image_path
+                }
+                for i in range(1, count + 1)
+            ]
+        }
+    ]
+    output_path = os.path.join("test_data", "test_image_exercises.docx")
+    WordGenerator().create_document(image_content, output_path)
+    
+    # 图片部件直接存储，文档部件仍然压缩
+    with zipfile.ZipFile(output_path) as zf:
+        for info in zf.infolist():
+            stored = info.compress_type == zipfile.ZIP_STORED
+            is_image = info.filename.endswith((".png", ".jpeg"))
+            assert stored == is_image, f"压缩方式不正确: {info.filename}"
+    
+    # 重新打开文档，确认保存的文件完整可读
+    doc = Document(output_path)
+    question_count = sum(1 for p in doc.paragraphs if p.style.name == "Question")
+    assert question_count == count * 2, f"题目段落数量不正确: {question_count}"
+    print(f"图片文档测试成功: {output_path}")
+
+def _write_png(path):
+    """写入一张1x1像素的PNG图片"""
+    def chunk(chunk_type, data):
+        crc = zlib.crc32(chunk_type + data) & 0xffffffff
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", crc)
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                + chunk(b"IDAT", zlib.compress(b"\x00\xff\x00\x00")) + chunk(b"IEND", b""))
+
+def test_picture_ids():
+    """测试文档中多张图片的编号唯一"""
+    print("开始测试图片编号...")
+    
+    if not os.path.exists("test_data"):
+        os.makedirs("test_data")
+    image_path = os.path.join("test_data", "test_image.png")
+    _write_png(image_path)
+    
+    # 两道看图写话题，各带一张本地图片
+    picture_content = [
+        {
+            "maxTitle": "看图写话练习题",
+            "require": "请根据图片提示写一段话。",
+            "questions": [
+                {
+                    "number": i,
+                    "question": "图片里有什么？",
+                    "reference_answer": "图片里有一只小猫。",
+                    "local_image_path": image_path
+                }
+                for i in (1, 2)
+            ]
+        }
+    ]
+    output_path = os.path.join("test_data", "test_picture_ids.docx")
+    WordGenerator().create_document(picture_content, output_path)
+    
+    doc = Document(output_path)
+    ids = doc.element.body.xpath(".//wp:docPr/@id")
+    assert len(ids) == 2, f"图片数量不正确: {len(ids)}"
+    assert len(set(ids)) == len(ids), f"图片编号重复: {ids}"
+    print(f"图片编号测试成功: {ids}")
+
+def test_non_dict_items():
+    """测试内容列表中夹杂非字典项时跳过这些项"""
+    print("开始测试非字典项...")
+    
+    if not os.path.exists("test_data"):
+        os.makedirs("test_data")
+    
+    # 模型有时会在题目数组中混入说明文字
+    mixed_content = [
+        "说明",
+        {
+            "maxTitle": "看图写话练习题",
+            "require": "请根据图片提示写一段话。",
+            "questions": [
+                "图片说明",
+                {
+                    "number": 1,
+                    "question": "图片里有什么？",
+                    "reference_answer": "图片里有一只小猫。"
+                }
+            ]
+        }
+    ]
+    output_path = os.path.join("test_data", "test_non_dict_items.docx")
+    WordGenerator().create_document(mixed_content, output_path)
+    
+    doc = Document(output_path)
+    question_count = sum(1 for p in doc.paragraphs if p.style.name == "Question")
+    # 题目和参考答案各一段
+    assert question_count == 2, f"题目段落数量不正确: {question_count}"
+    print(f"非字典项测试成功: {output_path}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
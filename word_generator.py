@@ -6,25 +6,398 @@ Word文档生成器：负责将题目内容转换为Word文档
 """
 
 import os
+import hashlib
 import logging
+import weakref
 import requests
 import tempfile
-from io import BytesIO
-from typing import Dict, Any, List, Union
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Dict, Any, List, Union, Callable, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING, WD_BREAK
 from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from docx.enum.section import WD_SECTION
+from docx.opc.pkgwriter import PackageWriter
+from docx.text.paragraph import Paragraph
+from lxml.etree import SubElement
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 日志由调用方配置，直接运行本模块时在main()中配置
 logger = logging.getLogger(__name__)
 
+# 常用尺寸和属性名，模块加载时计算一次
+_PT6 = Pt(6)
+_PT8 = Pt(8)
+_PT12 = Pt(12)
+_PT14 = Pt(14)
+_PT16 = Pt(16)
+_PT18 = Pt(18)
+_IN_025 = Inches(0.25)
+_IN_05 = Inches(0.5)
+_IN_5 = Inches(5)
+_EAST_ASIA = qn('w:eastAsia')
+
+# 标记样式名，文档中存在该样式说明本程序的样式已经安装过
+_STYLE_MARKER = '_pspg_marker'
+
+# 下载图片的磁盘缓存目录，以URL的哈希值命名缓存文件，重复生成文档时不再重新下载
+_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pspg_img_cache")
+
+# 单张图片的最大字节数，超过时放弃下载
+_MAX_IMAGE_BYTES = 8_000_000
+
+# 本身已经压缩过的图片格式，保存时不再压缩
+_STORED_EXTS = frozenset(("png", "jpg", "jpeg", "gif"))
+
+# 看图写话的写作横线和句子仿写的填空下划线
+_BLANK_LINE = "_" * 60
+_UNDER = "_" * 13
+
+# 直接构建段落XML时使用的标签名和文本格式
+_W_PPR = qn('w:pPr')
+_W_PSTYLE = qn('w:pStyle')
+_W_VAL = qn('w:val')
+_W_R = qn('w:r')
+_W_RPR = qn('w:rPr')
+_W_T = qn('w:t')
+_W_IND = qn('w:ind')
+_W_LEFT = qn('w:left')
+_W_JC = qn('w:jc')
+_RPR_BOLD = (qn('w:b'),)
+_RPR_ITALIC = (qn('w:i'),)
+
+# 段落模板，以(样式ID, 文本格式, 是否包含文本, 左缩进, 对齐方式)为键
+_P_TEMPLATES = {}
+
+
+def _build_p_template(style_id, run_props, with_text, left_indent, alignment):
+    """
+    构建段落模板元素
+    
+    Args:
+        style_id: 段落样式ID，为None时使用默认样式
+        run_props: 文本格式元素的标签名
+        with_text: 是否包含文本，包含时模板末尾为空的w:t元素
+        left_indent: 左缩进，为None时不设置
+        alignment: 对齐方式（WD_ALIGN_PARAGRAPH），为None时不设置
+        
+    Returns:
+        段落元素
+    """
+    p = OxmlElement('w:p')
+    if style_id is not None or left_indent is not None or alignment is not None:
+        # 子元素顺序需符合pPr的定义：pStyle、ind、jc
+        pPr = SubElement(p, _W_PPR)
+        if style_id is not None:
+            SubElement(pPr, _W_PSTYLE).set(_W_VAL, style_id)
+        if left_indent is not None:
+            SubElement(pPr, _W_IND).set(_W_LEFT, str(left_indent.twips))
+        if alignment is not None:
+            SubElement(pPr, _W_JC).set(_W_VAL, WD_ALIGN_PARAGRAPH.to_xml(alignment))
+    if with_text:
+        r = SubElement(p, _W_R)
+        if run_props:
+            rPr = SubElement(r, _W_RPR)
+            for tag in run_props:
+                SubElement(rPr, tag)
+        SubElement(r, _W_T)
+    return p
+
+
+def _append_p(parent, text="", style_id=None, run_props=(), left_indent=None, alignment=None):
+    """
+    在父元素末尾添加一个段落元素，跳过python-docx的段落、样式和文本对象
+    
+    同样格式的段落结构相同，只有文本不同，因此每种格式只构建一次模板，之后复制模板并填入文本；
+    文档中的所有段落都通过本函数构建
+    
+    Args:
+        parent: 父元素
+        text: 段落文本，为空时只添加空段落
+        style_id: 段落样式ID，为None时使用默认样式
+        run_props: 文本格式元素的标签名，如_RPR_BOLD
+        left_indent: 左缩进，为None时不设置
+        alignment: 对齐方式（WD_ALIGN_PARAGRAPH），为None时不设置
+        
+    Returns:
+        段落元素
+    """
+    key = (style_id, run_props, bool(text), left_indent, alignment)
+    template = _P_TEMPLATES.get(key)
+    if template is None:
+        template = _P_TEMPLATES[key] = _build_p_template(*key)
+    p = deepcopy(template)
+    if text:
+        r = p[-1]
+        if "\n" in text or "\t" in text or "\r" in text or text[0].isspace() or text[-1].isspace():
+            # CT_R的text属性会把换行符和制表符转换为对应的元素，并保留首尾空白
+            r.text = text
+        else:
+            r[-1].text = text
+    parent.append(p)
+    return p
+
+
+@dataclass(slots=True)
+class _Q:
+    """预处理后的题目，渲染时按属性访问，避免在循环中反复查找字典键"""
+    number: Any
+    question: str
+    text: str
+    answer: Optional[str] = None
+    imitate: Optional[List[str]] = None
+    prompt: Optional[str] = None
+    local_image_path: Optional[str] = None
+    image_url: Optional[str] = None
+
+
+def _compile_questions(questions: List[Dict]) -> List[_Q]:
+    """
+    将一个大题的题目字典列表转换为_Q列表
+    
+    Args:
+        questions: 题目字典列表
+        
+    Returns:
+        _Q列表，题号和问题拼接好的文本保存在text中
+    """
+    compiled = []
+    for question in questions:
+        if not isinstance(question, dict):
+            continue
+        imitate = question.get("Imitate_writing")
+        compiled.append(_Q(
+            number=question["number"],
+            question=question["question"],
+            text=f"{question['number']}. {question['question']}",
+            answer=question.get("reference_answer"),
+            imitate=imitate if isinstance(imitate, list) else None,
+            prompt=question.get("prompt"),
+            local_image_path=question.get("local_image_path"),
+            image_url=question.get("image_url"),
+        ))
+    return compiled
+
+
+class _FastZipPkgWriter:
+    """
+    与python-docx内部的zip写入器接口相同：使用最低压缩等级，已压缩的图片直接存储
+    
+    python-docx默认以zlib默认等级压缩所有部件，图片较多时大部分时间都花在重复压缩图片上
+    """
+
+    def __init__(self, pkg_file):
+        self._zipf = zipfile.ZipFile(pkg_file, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def write(self, pack_uri, blob):
+        compress_type = zipfile.ZIP_STORED if pack_uri.ext.lower() in _STORED_EXTS else None
+        self._zipf.writestr(pack_uri.membername, blob, compress_type=compress_type)
+
+    def close(self):
+        self._zipf.close()
+
+
+def _save_document(doc, output_path):
+    """
+    保存文档，文档包含图片时图片直接存储不再压缩，与doc.save的输出内容相同，只是压缩方式不同
+    
+    Args:
+        doc: Word文档对象
+        output_path: 输出文件路径
+    """
+    package = doc.part.package
+    parts = package.parts
+    # 没有图片时节省不了多少时间；python-docx的内部写入步骤不存在时也退回doc.save
+    has_images = any(part.partname.ext.lower() in _STORED_EXTS for part in parts)
+    if not has_images or not all(hasattr(PackageWriter, name) for name in (
+            "_write_content_types_stream", "_write_pkg_rels", "_write_parts")):
+        doc.save(output_path)
+        return
+    
+    # 与OpcPackage.save和PackageWriter.write的步骤相同，只替换zip写入器
+    for part in parts:
+        part.before_marshal()
+    writer = _FastZipPkgWriter(output_path)
+    try:
+        PackageWriter._write_content_types_stream(writer, parts)
+        PackageWriter._write_pkg_rels(writer, package.rels)
+        PackageWriter._write_parts(writer, parts)
+    finally:
+        writer.close()
+
+
+def _append_body_elements(doc, elements):
+    """将段落元素按顺序追加到文档正文末尾（节属性sectPr之前）"""
+    body = doc.element.body
+    sect_pr = body.sectPr
+    for element in elements:
+        if sect_pr is not None:
+            sect_pr.addprevious(element)
+        else:
+            body.append(element)
+
+
+class _ParagraphBatch:
+    """
+    段落批量写入器：段落元素先在游离的容器元素中构建，最后一次性插入文档正文
+    
+    Document.add_paragraph每次都要在正文中重新定位插入位置，文档越长越慢，
+    批量写入只在flush时定位一次
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.box = OxmlElement('w:body')
+
+    def add_text(self, text="", style_id=None, run_props=(), left_indent=None, alignment=None):
+        """构建一个段落并加入缓冲区，参数同_append_p"""
+        _append_p(self.box, text, style_id, run_props, left_indent, alignment)
+
+    def add_para(self, alignment=None) -> Paragraph:
+        """
+        构建一个空段落并加入缓冲区
+        
+        Args:
+            alignment: 对齐方式
+            
+        Returns:
+            段落对象，用于添加图片等需要python-docx处理的内容
+        """
+        return Paragraph(_append_p(self.box, alignment=alignment), self.doc)
+
+    def extend(self, elements):
+        """将多个已构建好的段落元素按顺序加入缓冲区"""
+        self.box.extend(elements)
+
+    def add_page_break(self):
+        """添加分页符"""
+        self.add_para().add_run().add_break(WD_BREAK.PAGE)
+
+    def flush(self):
+        """将缓冲区中的段落一次性插入文档正文"""
+        # 图片的编号由python-docx按正文中已有的最大id分配，缓冲区中的图片在插入前都拿到同一个编号，
+        # 插入前按顺序重新编号，保证文档中的图片编号唯一
+        doc_prs = self.box.xpath('.//wp:docPr')
+        if doc_prs:
+            next_id = self.doc.part.next_id
+            for offset, doc_pr in enumerate(doc_prs):
+                doc_pr.id = next_id + offset
+                doc_pr.name = f"Picture {next_id + offset}"
+        _append_body_elements(self.doc, list(self.box))
+
+
+_StyleHandles = namedtuple("_StyleHandles", [
+    "normal_id", "title_id", "section_id", "req_id", "q_id", "a_id",
+])
+
+# 已安装样式的文档部件及其样式ID，文档释放后自动移除
+# Document对象定义了__eq__而不可哈希，因此以文档部件为键
+_STYLE_CACHE = weakref.WeakKeyDictionary()
+
+
+def install_styles(doc) -> _StyleHandles:
+    """
+    安装文档样式并返回构建段落时使用的样式ID
+    
+    结果按文档缓存，只有对同一个文档再次调用时才会直接返回缓存结果；
+    create_document每次都新建文档，因此缓存只对自行多次调用本函数的调用方有用
+    
+    Args:
+        doc: Word文档对象
+        
+    Returns:
+        _StyleHandles，默认样式的ID为None，构建段落时不需要写入pStyle
+    """
+    handles = _STYLE_CACHE.get(doc.part)
+    if handles is not None:
+        return handles
+    
+    styles = doc.styles
+    # 模板已由之前的运行安装过样式时，不再重复修改样式
+    if _STYLE_MARKER not in styles:
+        _install_styles(styles)
+    
+    resolved = [styles[name] for name in ('Normal', 'Title', 'Section', 'Requirement', 'Question', 'Answer')]
+    default = styles.default(WD_STYLE_TYPE.PARAGRAPH)
+    handles = _StyleHandles(*(None if style == default else style.style_id for style in resolved))
+    _STYLE_CACHE[doc.part] = handles
+    return handles
+
+
+def _install_styles(styles):
+    """设置基础样式的字体并创建本程序使用的段落样式"""
+    # 设置中文字体，已经是宋体的基础样式跳过
+    for style_name in ('Normal', 'Heading 1', 'Heading 2', 'Heading 3'):
+        style = styles[style_name]
+        rPr = style.element.rPr
+        if rPr is not None and rPr.rFonts is not None and rPr.rFonts.get(_EAST_ASIA) == '宋体':
+            continue
+        font = style.font
+        font.name = 'Times New Roman'
+        font.size = _PT12
+        # 设置中文字体
+        font._element.rPr.rFonts.set(_EAST_ASIA, '宋体')
+    
+    # 创建自定义样式
+    if 'Title' not in styles:
+        title_style = styles.add_style('Title', WD_STYLE_TYPE.PARAGRAPH)
+        title_style.font.name = 'Times New Roman'
+        title_style.font.size = _PT18
+        title_style.font.bold = True
+        title_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        title_style.paragraph_format.space_after = _PT12
+        # 设置中文字体
+        title_style.font._element.rPr.rFonts.set(_EAST_ASIA, '黑体')
+    
+    if 'Section' not in styles:
+        section_style = styles.add_style('Section', WD_STYLE_TYPE.PARAGRAPH)
+        section_style.font.name = 'Times New Roman'
+        section_style.font.size = _PT16
+        section_style.font.bold = True
+        section_style.paragraph_format.space_before = _PT12
+        section_style.paragraph_format.space_after = _PT8
+        # 设置中文字体
+        section_style.font._element.rPr.rFonts.set(_EAST_ASIA, '黑体')
+    
+    if 'Requirement' not in styles:
+        req_style = styles.add_style('Requirement', WD_STYLE_TYPE.PARAGRAPH)
+        req_style.font.name = 'Times New Roman'
+        req_style.font.size = _PT14
+        req_style.font.italic = True
+        req_style.paragraph_format.space_after = _PT8
+        # 设置中文字体
+        req_style.font._element.rPr.rFonts.set(_EAST_ASIA, '楷体')
+    
+    if 'Question' not in styles:
+        q_style = styles.add_style('Question', WD_STYLE_TYPE.PARAGRAPH)
+        q_style.font.name = 'Times New Roman'
+        q_style.font.size = _PT12
+        q_style.paragraph_format.space_after = _PT6
+        q_style.paragraph_format.first_line_indent = _IN_025
+        # 设置中文字体
+        q_style.font._element.rPr.rFonts.set(_EAST_ASIA, '宋体')
+    
+    if 'Answer' not in styles:
+        a_style = styles.add_style('Answer', WD_STYLE_TYPE.PARAGRAPH)
+        a_style.font.name = 'Times New Roman'
+        a_style.font.size = _PT12
+        a_style.font.italic = True
+        a_style.paragraph_format.space_after = _PT6
+        a_style.paragraph_format.left_indent = _IN_05
+        # 设置中文字体
+        a_style.font._element.rPr.rFonts.set(_EAST_ASIA, '宋体')
+    
+    # 添加隐藏的标记样式，表示样式已安装
+    styles.add_style(_STYLE_MARKER, WD_STYLE_TYPE.PARAGRAPH).hidden = True
+
 
 class WordGenerator:
     """Word文档生成器类，负责创建和格式化Word文档"""
@@ -37,311 +410,336 @@ class WordGenerator:
             template_path: Word模板文件路径，如果为None则创建新文档
         """
         self.template_path = template_path
+        # 复用HTTP连接下载图片，避免每张图片重新建立TCP/TLS连接，连接失败时少量重试
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.3))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # 预先并发下载的图片文件路径，以URL为键
+        self._image_cache = {}
+        # 渲染第一个看图写话大题前需要等待的图片回调和文档内容，处理后置为None
+        self._images_pending = None
+        # 各题型的渲染方法，以大题标题为键
+        self._handlers = {
+            "句子仿写练习题": self._add_imitation_questions,
+            "看图写话练习题": self._add_picture_questions,
+        }
         logger.info("初始化Word文档生成器")
     
-    def create_document(self, content: List[Dict], output_path: str) -> str:
+    def create_document(self, content: List[Dict], output_path: str,
+                        wait_for_images: Optional[Callable[[], None]] = None) -> str:
         """
         创建Word文档
         
         Args:
             content: 文档内容，包含题目信息的列表
             output_path: 输出文件路径
+            wait_for_images: 可选回调，在渲染第一个看图写话大题之前调用，
+                用于在图片后台生成时等待图片就绪，此前的内容会先行渲染
             
         Returns:
             生成的文档路径
         """
-        logger.info(f"开始创建Word文档，输出路径: {output_path}")
+        logger.info("开始创建Word文档，输出路径: %s", output_path)
         
         # 创建文档对象
         if self.template_path and os.path.exists(self.template_path):
             doc = Document(self.template_path)
-            logger.info(f"使用模板创建文档: {self.template_path}")
+            logger.info("使用模板创建文档: %s", self.template_path)
         else:
             doc = Document()
             logger.info("创建新文档")
         
-        # 设置文档样式
-        self._setup_document_styles(doc)
+        # 设置文档样式，并缓存样式对象，添加段落时直接使用，避免每次按名称查找样式
+        self._styles = install_styles(doc)
+        
+        # 所有段落先写入批量缓冲区，保存前一次性插入文档
+        batch = _ParagraphBatch(doc)
         
         # 添加文档标题
-        self._add_title(doc, "小学二年级仿写练习题与看图写话练习题")
+        self._add_title(batch, "小学二年级仿写练习题与看图写话练习题")
         
-        # 收集所有参考答案，按大题分组
+        # 收集所有参考答案段落，按大题分组
         answers = []
+        self._images_pending = (wait_for_images, content)
         
         # 处理每种题型
         for item in content:
-            if "maxTitle" in item and "questions" in item:
+            if isinstance(item, dict) and "maxTitle" in item and "questions" in item:
                 # 添加大题标题
-                self._add_section_title(doc, item["maxTitle"])
+                self._add_section_title(batch, item["maxTitle"])
                 
                 # 添加题目要求
                 if "require" in item:
-                    self._add_requirement(doc, item["require"])
+                    self._add_requirement(batch, item["require"])
                 
-                # 收集当前大题的答案
-                current_answers = {"title": item["maxTitle"], "answers": []}
+                # 当前大题的参考答案段落在写题目时一并构建，放在游离的容器元素中
+                current_answers = OxmlElement('w:body')
                 
                 # 处理题目
-                if item["maxTitle"] == "句子仿写练习题":
-                    self._add_imitation_questions(doc, item["questions"], current_answers)
-                elif item["maxTitle"] == "看图写话练习题":
-                    self._add_picture_questions(doc, item["questions"], current_answers)
+                handler = self._handlers.get(item["maxTitle"])
+                if handler is not None:
+                    handler(batch, item["questions"], current_answers)
                 
                 # 添加到总答案列表
-                if current_answers["answers"]:
-                    answers.append(current_answers)
+                if len(current_answers):
+                    answers.append((item["maxTitle"], current_answers))
         
         # 添加分页符
-        doc.add_page_break()
+        batch.add_page_break()
         
         # 添加答案部分
-        self._add_answers_section(doc, answers)
+        self._add_answers_section(batch, answers)
+        
+        # 将所有段落插入文档
+        batch.flush()
         
         # 保存文档
-        doc.save(output_path)
+        _save_document(doc, output_path)
+        self._image_cache = {}
+        self._images_pending = None
         
-        logger.info(f"文档创建完成: {output_path}")
+        logger.info("文档创建完成: %s", output_path)
         return output_path
     
-    def _setup_document_styles(self, doc):
-        """设置文档样式"""
-        # 设置中文字体
-        style_names = ['Normal', 'Heading 1', 'Heading 2', 'Heading 3']
-        for style_name in style_names:
-            style = doc.styles[style_name]
-            font = style.font
-            font.name = 'Times New Roman'
-            font.size = Pt(12)
-            # 设置中文字体
-            font._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-        
-        # 创建自定义样式
-        if 'Title' not in doc.styles:
-            title_style = doc.styles.add_style('Title', WD_STYLE_TYPE.PARAGRAPH)
-            title_style.font.name = 'Times New Roman'
-            title_style.font.size = Pt(18)
-            title_style.font.bold = True
-            title_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            title_style.paragraph_format.space_after = Pt(12)
-            # 设置中文字体
-            title_style.font._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
-        
-        if 'Section' not in doc.styles:
-            section_style = doc.styles.add_style('Section', WD_STYLE_TYPE.PARAGRAPH)
-            section_style.font.name = 'Times New Roman'
-            section_style.font.size = Pt(16)
-            section_style.font.bold = True
-            section_style.paragraph_format.space_before = Pt(12)
-            section_style.paragraph_format.space_after = Pt(8)
-            # 设置中文字体
-            section_style.font._element.rPr.rFonts.set(qn('w:eastAsia'), '黑体')
-        
-        if 'Requirement' not in doc.styles:
-            req_style = doc.styles.add_style('Requirement', WD_STYLE_TYPE.PARAGRAPH)
-            req_style.font.name = 'Times New Roman'
-            req_style.font.size = Pt(14)
-            req_style.font.italic = True
-            req_style.paragraph_format.space_after = Pt(8)
-            # 设置中文字体
-            req_style.font._element.rPr.rFonts.set(qn('w:eastAsia'), '楷体')
-        
-        if 'Question' not in doc.styles:
-            q_style = doc.styles.add_style('Question', WD_STYLE_TYPE.PARAGRAPH)
-            q_style.font.name = 'Times New Roman'
-            q_style.font.size = Pt(12)
-            q_style.paragraph_format.space_after = Pt(6)
-            q_style.paragraph_format.first_line_indent = Inches(0.25)
-            # 设置中文字体
-            q_style.font._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-        
-        if 'Answer' not in doc.styles:
-            a_style = doc.styles.add_style('Answer', WD_STYLE_TYPE.PARAGRAPH)
-            a_style.font.name = 'Times New Roman'
-            a_style.font.size = Pt(12)
-            a_style.font.italic = True
-            a_style.paragraph_format.space_after = Pt(6)
-            a_style.paragraph_format.left_indent = Inches(0.5)
-            # 设置中文字体
-            a_style.font._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
-    
-    def _add_title(self, doc, title):
+    def _add_title(self, batch, title):
         """添加文档标题"""
-        paragraph = doc.add_paragraph(title, style='Title')
-        doc.add_paragraph()  # 添加空行
+        batch.add_text(title, self._styles.title_id)
+        batch.add_text()  # 添加空行
     
-    def _add_section_title(self, doc, title):
+    def _add_section_title(self, batch, title):
         """添加大题标题"""
-        paragraph = doc.add_paragraph(title, style='Section')
+        batch.add_text(title, self._styles.section_id)
     
-    def _add_requirement(self, doc, requirement):
+    def _add_requirement(self, batch, requirement):
         """添加题目要求"""
-        paragraph = doc.add_paragraph(requirement, style='Requirement')
+        batch.add_text(requirement, self._styles.req_id)
+    
+    def _ensure_images(self):
+        """等待图片就绪并并发下载所有需要从URL获取的图片，每个文档只在第一个看图写话大题前进行一次"""
+        if self._images_pending is None:
+            return
+        wait_for_images, content = self._images_pending
+        self._images_pending = None
+        if wait_for_images is not None:
+            wait_for_images()
+        self._prefetch_images(content)
+    
+    def _prefetch_images(self, content):
+        """
+        并发下载所有没有可用本地图片的看图写话题图片，结果保存在self._image_cache中
+        
+        Args:
+            content: 文档内容，包含题目信息的列表
+        """
+        urls = []
+        for item in content:
+            if not isinstance(item, dict) or item.get("maxTitle") != "看图写话练习题":
+                continue
+            for question in item.get("questions", []):
+                if not isinstance(question, dict):
+                    continue
+                local_path = question.get("local_image_path")
+                if local_path and os.path.exists(local_path):
+                    continue
+                url = question.get("image_url")
+                if url and url not in self._image_cache and url not in urls:
+                    urls.append(url)
+        
+        if not urls:
+            return
+        
+        logger.info("开始并发下载图片，数量: %s", len(urls))
+        with ThreadPoolExecutor(max_workers=min(8, len(urls))) as executor:
+            for url, image_path in zip(urls, executor.map(self._download_image, urls)):
+                self._image_cache[url] = image_path
     
     def _download_image(self, url):
         """
-        从URL下载图片
+        从URL下载图片，保存到磁盘缓存目录
         
         Args:
             url: 图片URL
             
         Returns:
-            图片的二进制数据
+            图片文件路径，下载失败时返回None
         """
+        key = hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+        cache_path = os.path.join(_CACHE_DIR, f"{key}.bin")
+        if os.path.exists(cache_path):
+            return cache_path
+        
+        tmp_path = None
         try:
-            response = requests.get(url, timeout=30)
-            if response.status_code == 200:
-                return BytesIO(response.content)
-            else:
-                logger.error(f"下载图片失败，状态码: {response.status_code}")
-                return None
+            # 分别设置连接超时和读取超时
+            with self._session.get(url, stream=True, timeout=(3.05, 27)) as response:
+                if response.status_code != 200:
+                    logger.error("下载图片失败，状态码: %s", response.status_code)
+                    return None
+                
+                # 读取响应体之前根据Content-Length拒绝过大的图片，
+                # 没有Content-Length时在读取过程中检查
+                content_length = int(response.headers.get("Content-Length") or 0)
+                if content_length > _MAX_IMAGE_BYTES:
+                    logger.error("图片过大，放弃下载: %s 字节", content_length)
+                    return None
+                
+                # 按块直接写入缓存目录下的临时文件，完整下载后再重命名，
+                # 避免并发下载或中断时留下不完整的缓存文件
+                os.makedirs(_CACHE_DIR, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=_CACHE_DIR, suffix=".tmp")
+                size = 0
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > _MAX_IMAGE_BYTES:
+                            logger.error("图片超过 %s 字节，放弃下载", _MAX_IMAGE_BYTES)
+                            return None
+                        f.write(chunk)
+            os.replace(tmp_path, cache_path)
+            tmp_path = None
+            return cache_path
         except Exception as e:
-            logger.error(f"下载图片时发生错误: {str(e)}")
+            logger.error("下载图片时发生错误: %s", e)
             return None
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
-    def _add_imitation_questions(self, doc, questions, answers_collector):
+    def _add_imitation_questions(self, batch, questions, answers_collector):
         """添加句子仿写题"""
-        for question in questions:
+        for question in _compile_questions(questions):
             # 添加题号和问题
-            q_text = f"{question['number']}. {question['question']}"
-            paragraph = doc.add_paragraph(q_text, style='Question')
+            batch.add_text(question.text, self._styles.q_id)
             
             # 添加仿写空格
-            if "Imitate_writing" in question and isinstance(question["Imitate_writing"], list):
-                imitate_text = ""
-                for i, word in enumerate(question["Imitate_writing"]):
-                    if i > 0:
-                        # 添加下划线空格
-                        imitate_text += "_____________"
-                    imitate_text += word
-                
-                # 最后一个词后也添加下划线
-                imitate_text += "_____________"
+            if question.imitate is not None:
+                # 词与词之间以及最后一个词后添加下划线空格
+                imitate_text = _UNDER.join(question.imitate) + _UNDER
                 
-                p = doc.add_paragraph(style='Normal')
-                p.paragraph_format.left_indent = Inches(0.5)
-                p.add_run(imitate_text)
+                batch.add_text(imitate_text, self._styles.normal_id, left_indent=_IN_05)
             
-            # 收集参考答案
-            if "reference_answer" in question:
-                answers_collector["answers"].append({
-                    "number": question["number"],
-                    "question": question["question"],
-                    "answer": question["reference_answer"]
-                })
+            # 构建参考答案段落
+            if question.answer is not None:
+                self._append_answer(answers_collector, question)
             
             # 添加空行
-            doc.add_paragraph()
+            batch.add_text()
     
-    def _add_picture_questions(self, doc, questions, answers_collector):
+    def _add_picture_questions(self, batch, questions, answers_collector):
         """添加看图写话题"""
-        for question in questions:
+        # 图片路径在等待回调中才写回题目，因此等待图片就绪之后再转换题目
+        self._ensure_images()
+        for question in _compile_questions(questions):
             # 添加题号和问题
-            q_text = f"{question['number']}. {question['question']}"
-            paragraph = doc.add_paragraph(q_text, style='Question')
+            batch.add_text(question.text, self._styles.q_id)
             
             # 添加图片 - 优先使用本地图片路径，如果没有则尝试从URL下载
             image_added = False
             
             # 如果有本地图片路径，直接使用本地图片
-            if "local_image_path" in question and question["local_image_path"]:
+            if question.local_image_path:
                 try:
-                    local_path = question["local_image_path"]
+                    local_path = question.local_image_path
                     if os.path.exists(local_path):
                         # 添加图片到文档
-                        p = doc.add_paragraph()
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                        p = batch.add_para(alignment=WD_ALIGN_PARAGRAPH.CENTER)
                         run = p.add_run()
-                        run.add_picture(local_path, width=Inches(5))
-                        logger.info(f"成功从本地添加图片到题目 {question['number']}")
+                        run.add_picture(local_path, width=_IN_5)
+                        logger.info("成功从本地添加图片到题目 %s", question.number)
                         image_added = True
                     else:
-                        logger.warning(f"本地图片文件不存在: {local_path}")
+                        logger.warning("本地图片文件不存在: %s", local_path)
                 except Exception as e:
-                    logger.error(f"添加本地图片时发生错误: {str(e)}")
+                    logger.error("添加本地图片时发生错误: %s", e)
             
             # 如果没有成功添加本地图片，尝试从URL下载
-            if not image_added and "image_url" in question and question["image_url"]:
+            if not image_added and question.image_url:
                 try:
-                    # 下载图片
-                    image_data = self._download_image(question["image_url"])
-                    if image_data:
+                    # 优先使用预先下载的图片，没有预先下载时再下载
+                    url = question.image_url
+                    if url in self._image_cache:
+                        image_path = self._image_cache[url]
+                    else:
+                        image_path = self._download_image(url)
+                    if image_path:
                         # 添加图片到文档
-                        p = doc.add_paragraph()
-                        p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                        p = batch.add_para(alignment=WD_ALIGN_PARAGRAPH.CENTER)
                         run = p.add_run()
-                        run.add_picture(image_data, width=Inches(5))
-                        logger.info(f"成功从URL添加图片到题目 {question['number']}")
+                        run.add_picture(image_path, width=_IN_5)
+                        logger.info("成功从URL添加图片到题目 %s", question.number)
                         image_added = True
                     else:
-                        logger.warning(f"无法下载图片，题目 {question['number']}")
+                        logger.warning("无法下载图片，题目 %s", question.number)
                 except Exception as e:
-                    logger.error(f"添加URL图片时发生错误: {str(e)}")
+                    logger.error("添加URL图片时发生错误: %s", e)
             
             # 不再在图片下方显示图片描述，而是将其添加到参考答案中
             
             # 添加写作空间
-            p = doc.add_paragraph(style='Normal')
-            p.paragraph_format.left_indent = Inches(0.5)
-            p.add_run("写话：").bold = True
+            batch.add_text("写话：", self._styles.normal_id, _RPR_BOLD, left_indent=_IN_05)
             
-            # 添加多行空白供学生写作
-            for i in range(8):
-                doc.add_paragraph("_" * 60, style='Normal')
-                # 在循环最后一次加上句号
-                if i == 7:
-                    doc.add_paragraph("。", style='Normal')
+            # 添加多行空白供学生写作，最后加上句号
+            for _ in range(8):
+                batch.add_text(_BLANK_LINE)
+            batch.add_text("。", self._styles.normal_id)
             
-            # 收集参考答案和图片描述
-            if "reference_answer" in question:
-                answer_data = {
-                    "number": question["number"],
-                    "question": question["question"],
-                    "answer": question["reference_answer"]
-                }
-                
-                # 如果有图片描述，添加到参考答案中
-                if "prompt" in question:
-                    answer_data["prompt"] = question["prompt"]
-                
-                answers_collector["answers"].append(answer_data)
+            # 构建参考答案段落，图片描述放在参考答案之前
+            if question.answer is not None:
+                self._append_answer(answers_collector, question, with_prompt=True)
             
             # 添加空行
-            doc.add_paragraph()
+            batch.add_text()
     
-    def _add_answers_section(self, doc, answers):
-        """添加答案部分"""
+    def _append_answer(self, answers_collector, question, with_prompt=False):
+        """
+        构建一道题的参考答案段落，追加到当前大题的答案容器中
+        
+        Args:
+            answers_collector: 当前大题的答案容器元素
+            question: 题目
+            with_prompt: 是否在参考答案前添加图片描述
+        """
+        # 添加题号和问题
+        _append_p(answers_collector, question.text, self._styles.q_id)
+        
+        # 如果有图片描述，先添加图片描述
+        if with_prompt and question.prompt is not None:
+            _append_p(answers_collector, f"图片描述：{question.prompt}", self._styles.a_id, _RPR_ITALIC)
+        
+        # 添加参考答案
+        _append_p(answers_collector, f"参考答案：{question.answer}", self._styles.a_id, _RPR_ITALIC)
+    
+    def _add_answers_section(self, batch, answers):
+        """
+        添加答案部分
+        
+        Args:
+            batch: 段落批量写入器
+            answers: (大题标题, 参考答案容器元素)列表，参考答案段落在写题目时已经构建好
+        """
         # 添加答案标题
-        self._add_title(doc, "参考答案")
+        self._add_title(batch, "参考答案")
         
         # 处理每种题型的答案
-        for answer_group in answers:
+        for title, fragments in answers:
             # 添加大题标题
-            self._add_section_title(doc, f"{answer_group['title']}参考答案")
+            self._add_section_title(batch, f"{title}参考答案")
             
-            # 添加每道题的答案
-            for answer_item in answer_group["answers"]:
-                # 添加题号和问题
-                q_text = f"{answer_item['number']}. {answer_item['question']}"
-                paragraph = doc.add_paragraph(q_text, style='Question')
-                
-                # 如果是看图写话题目且有图片描述，先添加图片描述
-                if answer_group['title'] == "看图写话练习题" and "prompt" in answer_item:
-                    p = doc.add_paragraph(style='Answer')
-                    run = p.add_run(f"图片描述：{answer_item['prompt']}")
-                    run.italic = True
-                
-                # 添加参考答案
-                p = doc.add_paragraph(style='Answer')
-                run = p.add_run(f"参考答案：{answer_item['answer']}")
-                run.italic = True
+            # 移入已构建好的参考答案段落
+            batch.extend(list(fragments))
             
             # 在不同大题之间添加空行
-            doc.add_paragraph()
+            batch.add_text()
 
 
 def main():
     """测试函数"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     # 简单的测试数据
     test_content = [
             {